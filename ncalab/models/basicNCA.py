@@ -1,4 +1,5 @@
 from __future__ import annotations
+import math
 from typing import Callable, Optional, Dict, Tuple
 
 import numpy as np
@@ -6,6 +7,7 @@ import numpy as np
 import torch  # type: ignore[import-untyped]
 import torch.nn as nn  # type: ignore[import-untyped]
 import torch.nn.functional as F  # type: ignore[import-untyped]
+from torch.utils.checkpoint import checkpoint  # type: ignore[import-untyped]
 
 from ..autostepper import AutoStepper
 from ..prediction import Prediction
@@ -36,6 +38,7 @@ class BasicNCAModel(nn.Module):
         pad_noise: bool = False,
         autostepper: Optional[AutoStepper] = None,
         use_temporal_encoding: bool = False,
+        use_checkpoint: bool = False,
     ):
         """
         Constructor.
@@ -54,6 +57,8 @@ class BasicNCAModel(nn.Module):
         :param kernel_size [int]: Filter kernel size (only for learned filters)
         :param pad_noise [bool]: Whether to pad input image tensor with noise in hidden / output channels
         :param autostepper [Optional[AutoStepper]]: AutoStepper object to select number of time steps based on activity
+        :param use_temporal_encoding [bool]: Whether to add the normalized time step as an additional perception channel. Defaults to False.
+        :param use_checkpoint [bool]: Whether to use gradient checkpointing over the time steps during training, trading compute for memory. Defaults to False.
         """
         super(BasicNCAModel, self).__init__()
 
@@ -77,6 +82,7 @@ class BasicNCAModel(nn.Module):
         self.pad_noise = pad_noise
         self.autostepper = autostepper
         self.use_temporal_encoding = use_temporal_encoding
+        self.use_checkpoint = use_checkpoint
         self.plot_function = plot_function
         self.validation_metric = validation_metric
 
@@ -120,6 +126,7 @@ class BasicNCAModel(nn.Module):
         :param num_learned_filters [int]: Number of learned filters in perception filter bank.
         """
         self.filters: list | nn.ModuleList = []
+        self.register_buffer("fixed_filters", None)
         if num_learned_filters > 0:
             self.num_filters = num_learned_filters
             filters = []
@@ -145,6 +152,16 @@ class BasicNCAModel(nn.Module):
             if self.use_laplace:
                 self.filters.append(laplace)
             self.num_filters = len(self.filters)
+            # built once in depthwise convolution shape, FC1WH; not part of the
+            # state dict, so existing checkpoints still load
+            kernels = torch.from_numpy(np.stack(self.filters).astype(np.float32))
+            self.register_buffer(
+                "fixed_filters",
+                kernels[:, None, None, :, :]
+                .repeat(1, self.num_channels, 1, 1, 1)
+                .to(self.device),
+                persistent=False,
+            )
 
     def prepare_input(self, x: torch.Tensor) -> torch.Tensor:
         """
@@ -170,25 +187,27 @@ class BasicNCAModel(nn.Module):
         return mask
 
     def _perceive(self, x, step) -> torch.Tensor:
-        def _perceive_with(x, weight):
-            if isinstance(weight, nn.Conv2d):
-                return weight(x)
-            # if using a hard coded filter matrix.
+        perception = [x]
+        if self.fixed_filters is None:
+            perception.extend([f(x) for f in self.filters])
+        else:
+            # if using hard coded filter matrices.
             # this is done in the original Growing NCA paper, but learned filters typically
             # work better.
-            conv_weights = torch.from_numpy(weight.astype(np.float32)).to(self.device)
-            conv_weights = conv_weights.view(1, 1, 3, 3).repeat(
-                self.num_channels, 1, 1, 1
+            perception.extend(
+                [
+                    F.conv2d(x, w, padding=1, groups=self.num_channels)
+                    for w in self.fixed_filters
+                ]
             )
-            return F.conv2d(x, conv_weights, padding=1, groups=self.num_channels)
-
-        perception = [x]
-        perception.extend([_perceive_with(x, w) for w in self.filters])
         if self.use_temporal_encoding:
             perception.append(
-                torch.mul(
-                    torch.ones((x.shape[0], 1, x.shape[2], x.shape[3])), step / 100
-                ).to(self.device)
+                torch.full(
+                    (x.shape[0], 1, x.shape[2], x.shape[3]),
+                    step / 100,
+                    dtype=x.dtype,
+                    device=x.device,
+                )
             )
         dx = torch.cat(perception, 1)
         return dx
@@ -210,40 +229,78 @@ class BasicNCAModel(nn.Module):
 
         # Stochastic weight update
         fire_rate = self.fire_rate
-        stochastic = torch.rand([dx.size(0), 1, dx.size(2), dx.size(3)]) < fire_rate
-        stochastic = stochastic.float().to(self.device)
+        # sampled directly on device, avoids a host allocation and copy in every step
+        stochastic = (
+            torch.rand([dx.size(0), 1, dx.size(2), dx.size(3)], device=dx.device)
+            < fire_rate
+        )
+        stochastic = stochastic.to(dx.dtype)
         dx = dx * stochastic
 
         if self.immutable_image_channels:
             dx[:, : self.num_image_channels, :, :] *= 0
         return dx
 
+    def _step(self, x: torch.Tensor, step: int) -> torch.Tensor:
+        """
+        Single NCA time step, including alive masking.
+
+        :param x [torch.Tensor]: Input tensor, BCWH
+        :param step [int]: Current timestep.
+
+        :returns [torch.Tensor]: Updated tensor, BCWH
+        """
+        dx = self._update(x, step)
+        x = x + dx
+
+        # Alive masking
+        if self.use_alive_mask:
+            life_mask = self._alive(x)
+            x = x.permute(1, 0, 2, 3)  # B C W H --> C B W H
+            x = x * life_mask.float()
+            x = x.permute(1, 0, 2, 3)  # C B W H --> B C W H
+        return x
+
+    def _steps(self, x: torch.Tensor, start: int, stop: int) -> torch.Tensor:
+        """
+        Run NCA time steps in range [start, stop).
+
+        :param x [torch.Tensor]: Input tensor, BCWH
+        :param start [int]: First timestep.
+        :param stop [int]: Timestep to stop at (exclusive).
+
+        :returns [torch.Tensor]: Updated tensor, BCWH
+        """
+        for step in range(start, stop):
+            x = self._step(x, step)
+        return x
+
     def forward(
         self,
         x: torch.Tensor,
         steps: int = 1,
     ) -> Prediction:
         """
+        Operates out-of-place, the input tensor is never modified. Hence, callers
+        do not need to clone it beforehand.
+
         :param x [torch.Tensor]: Input image, padded along the channel dimension, BCWH.
         :param steps [int]: Time steps in forward pass.
 
         :returns [Prediction]: Prediction object.
         """
         if self.autostepper is None:
-            for step in range(steps):
-                dx = self._update(x, step)
-                x = x + dx
-
-                # Alive masking
-                if self.use_alive_mask:
-                    life_mask = self._alive(x)
-                    life_mask = life_mask
-                    x = x.permute(1, 0, 2, 3)  # B C W H --> C B W H
-                    x = x * life_mask.float()
-                    x = x.permute(1, 0, 2, 3)  # C B W H --> B C W H
+            if self.use_checkpoint and torch.is_grad_enabled():
+                # Only keep activations at chunk boundaries, recompute the rest in
+                # backward pass. Chunks of sqrt(steps) minimize peak memory.
+                chunk_size = max(1, int(math.sqrt(steps)))
+                for start in range(0, steps, chunk_size):
+                    stop = min(start + chunk_size, steps)
+                    x = checkpoint(self._steps, x, start, stop, use_reentrant=False)
+            else:
+                x = self._steps(x, 0, steps)
             return Prediction(self, steps, x)
 
-
         for step in range(self.autostepper.max_steps):
             if self.autostepper.check(step):
                 return Prediction(self, step, x)
@@ -256,16 +313,7 @@ class BasicNCAModel(nn.Module):
                 :,
             ]
             # single inference time step
-            dx = self._update(x, step)
-            x = x + dx
-
-            # Alive masking
-            if self.use_alive_mask:
-                life_mask = self._alive(x)
-                life_mask = life_mask
-                x = x.permute(1, 0, 2, 3)  # B C W H --> C B W H
-                x = x * life_mask.float()
-                x = x.permute(1, 0, 2, 3)  # C B W H --> B C W H
+            x = self._step(x, step)
 
             # set current hidden state
             self.autostepper.hidden_i = x[
@@ -325,8 +373,7 @@ class BasicNCAModel(nn.Module):
         assert image.shape[1] <= self.num_channels
         self.eval()
         with torch.no_grad():
-            x = image.clone()
-            x = pad_input(x, self, noise=self.pad_noise)
+            x = pad_input(image, self, noise=self.pad_noise)
             x = self.prepare_input(x)
             prediction = self.forward(x, steps=steps)
             return prediction
@@ -71,6 +71,7 @@ class CascadeNCA(BasicNCAModel):
             pad_noise=backbone.pad_noise,
             autostepper=backbone.autostepper,
             use_temporal_encoding=backbone.use_temporal_encoding,
+            use_checkpoint=backbone.use_checkpoint,
         )
         self.loss = backbone.loss  # type: ignore[method-assign]
         self.finetune = backbone.finetune  # type: ignore[method-assign]
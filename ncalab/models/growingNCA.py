@@ -89,7 +89,7 @@ class GrowingNCAModel(BasicNCAModel):
         with torch.no_grad():
             # TODO make use of autostepper, if available
             self.eval()
-            x = torch.zeros((1, self.num_channels, width, height)).to(self.device)
+            x = torch.zeros((1, self.num_channels, width, height), device=self.device)
             # set seed in center
             x[:, 3:, width // 2, height // 2] = 1.0
 
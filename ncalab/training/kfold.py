@@ -36,21 +36,32 @@ class TrainValRecord:
         path: Path | PosixPath,
         transform=None,
         batch_sizes=None,
+        pin_memory: bool = False,
     ):
         """
         Generate a pair of training and validation DataLoader objects, based on
         a given DataSet subtype.
+
+        :param pin_memory [bool]: Whether to pin host memory, only useful when training on CUDA. Defaults to False.
         """
         if batch_sizes is None:
             batch_sizes = {"train": 8, "val": 8}
         dataset_train = DatasetType(path, self.train, transform)
         dataloader_train = DataLoader(
-            dataset_train, shuffle=True, drop_last=True, batch_size=batch_sizes["train"]
+            dataset_train,
+            shuffle=True,
+            drop_last=True,
+            batch_size=batch_sizes["train"],
+            pin_memory=pin_memory,
         )
 
         dataset_val = DatasetType(path, self.val, transform)
         dataloader_val = DataLoader(
-            dataset_val, shuffle=True, drop_last=True, batch_size=batch_sizes["val"]
+            dataset_val,
+            shuffle=True,
+            drop_last=True,
+            batch_size=batch_sizes["val"],
+            pin_memory=pin_memory,
         )
 
         return {
@@ -152,7 +163,11 @@ class KFoldCrossValidationTrainer:
             writer = SummaryWriter(comment=experiment_name)
 
             dataloaders = self.split[i].dataloaders(
-                DatasetType, datapath, transform, batch_sizes
+                DatasetType,
+                datapath,
+                transform,
+                batch_sizes,
+                pin_memory=self.model_prototype.device.type == "cuda",
             )
             self.trainer.nca = copy.deepcopy(self.model_prototype)
             self.trainer.model_path = Path(experiment_name)
@@ -12,9 +12,20 @@ class Pool:
 
     def update(self, batch: torch.Tensor):
         """
+        Store a batch in the pool. The pool buffer lives on the same device as the
+        given batch and is overwritten in-place, to avoid re-allocating it in
+        every training step.
+
         :param batch: BCWH
         """
-        self.batch = torch.clone(batch)
+        if (
+            self.batch is None
+            or self.batch.shape != batch.shape
+            or self.batch.device != batch.device
+            or self.batch.dtype != batch.dtype
+        ):
+            self.batch = torch.empty_like(batch)
+        self.batch.copy_(batch.detach())
 
     def sample(self, seed: torch.Tensor) -> torch.Tensor:
         """
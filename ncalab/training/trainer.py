@@ -1,8 +1,7 @@
 from __future__ import annotations
-import copy
 import logging
 from pathlib import Path, PosixPath  # for type hint
-from typing import Callable, Dict, Optional, List, Tuple
+from typing import Callable, Dict, Iterable, Optional, List, Tuple
 
 import numpy as np
 
@@ -17,13 +16,111 @@ from tqdm import tqdm  # type: ignore[import-untyped]
 
 from ..models.basicNCA import BasicNCAModel  # for type hint
 from ..prediction import Prediction
-from ..utils import pad_input, unwrap
+from ..utils import pad_input
 
 from .earlystopping import EarlyStopping
 from .pool import Pool
 from .trainingsummary import TrainingSummary
 
 
+def _repeat_batch(x: torch.Tensor, repeats: int) -> torch.Tensor:
+    """
+    Repeat a batch along the batch dimension, in the same order as concatenating
+    copies of it, but with a single allocation and copy.
+
+    :param x [torch.Tensor]: Batch tensor of arbitrary dimension, batch first.
+    :param repeats [int]: Number of repetitions.
+
+    :returns [torch.Tensor]: Tensor with repeats * len(x) entries.
+    """
+    return x.expand(repeats, *x.shape).reshape(-1, *x.shape[1:])
+
+
+class _CudaPrefetcher:
+    """
+    Iterates a training DataLoader and prepares the next batch on a side CUDA
+    stream, while the current batch is being processed on the default stream.
+
+    Preparation covers the transfer to the compute device, channel padding and
+    the model-specific input preparation hook. Pool sampling is left to the
+    caller, as it depends on the outcome of the previous training iteration.
+    Without a side stream, e.g. on devices other than CUDA, batches are prepared
+    synchronously.
+    """
+
+    def __init__(
+        self,
+        dataloader: DataLoader,
+        nca: BasicNCAModel,
+        stream: Optional[torch.cuda.Stream] = None,
+    ):
+        """
+        :param dataloader [DataLoader]: Training DataLoader, yielding (x, y) pairs.
+        :param nca [BasicNCAModel]: NCA model to prepare inputs for.
+        :param stream [torch.cuda.Stream]: Side stream to prepare batches on. If None, batches are prepared synchronously. Defaults to None.
+        """
+        self.loader = iter(dataloader)
+        self.nca = nca
+        self.device = nca.device
+        self.stream = stream
+        self.next_batch: Optional[Tuple[torch.Tensor, torch.Tensor]] = None
+        self._preload()
+
+    def _prepare(
+        self, x: torch.Tensor, y: torch.Tensor
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        x = x.to(self.device, non_blocking=True)  # BCWH
+        y = y.to(self.device, non_blocking=True)  # BWHC
+        if len(y.shape) == 4:
+            y = y.permute(0, 3, 1, 2)  # BWHC --> BCWH
+
+        # Typically, our dataloader supplies a binary, grayscale, RGB or RGBA image.
+        # But the NCA operates on multiple hidden channels and output channels, so we
+        # need to pad the input image with zeros.
+        x = pad_input(x, self.nca, noise=self.nca.pad_noise)
+        # Call model-specific input preparation hook
+        x = self.nca.prepare_input(x)
+        return x, y
+
+    def _preload(self):
+        try:
+            x, y = next(self.loader)
+        except StopIteration:
+            self.next_batch = None
+            return
+        if self.stream is None:
+            self.next_batch = self._prepare(x, y)
+            return
+        with torch.cuda.stream(self.stream):
+            self.next_batch = self._prepare(x, y)
+
+    def next(self) -> Optional[Tuple[torch.Tensor, torch.Tensor]]:
+        """
+        Return the prepared batch and start preparing the subsequent one.
+
+        :returns: Tuple of device tensors (x, y), or None if exhausted.
+        """
+        batch = self.next_batch
+        if self.stream is not None:
+            current_stream = torch.cuda.current_stream(self.device)
+            current_stream.wait_stream(self.stream)
+            if batch is not None:
+                # tensors were allocated on the side stream, but are consumed here
+                for tensor in batch:
+                    tensor.record_stream(current_stream)
+        self._preload()
+        return batch
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Tuple[torch.Tensor, torch.Tensor]:
+        batch = self.next()
+        if batch is None:
+            raise StopIteration
+        return batch
+
+
 class BasicNCATrainer:
     """
     Trainer class for any model subclassing BasicNCA.
@@ -43,6 +140,10 @@ class BasicNCATrainer:
         max_epochs: int = 200,
         optimizer_method: str = "adam",
         pool: Optional[Pool] = None,
+        mixed_precision: bool = False,
+        compile_model: bool = False,
+        use_checkpoint: bool = False,
+        log_every: int = 50,
     ):
         """
         Initialize trainer object.
@@ -58,10 +159,15 @@ class BasicNCATrainer:
         :param batch_repeat (int, optional): How often each batch will be duplicated. Defaults to 2.
         :param max_epochs (int, optional): Maximum number of epochs in training. Defaults to 200.
         :param optimizer_method: Optimization method. Defaults to 'adamw'.
+        :param mixed_precision (bool, optional): Whether to train with automatic mixed precision on CUDA and CPU devices. Uses bfloat16 on CPU, and on CUDA if supported, float16 otherwise. Defaults to False.
+        :param compile_model (bool, optional): Whether to compile the NCA forward pass with torch.compile during training. Defaults to False.
+        :param use_checkpoint (bool, optional): Whether to use gradient checkpointing over NCA time steps, reducing memory at the cost of recomputation. Defaults to False.
+        :param log_every (int, optional): How often to log training losses to tensorboard (in batch iterations). Each log requires a device synchronization. Defaults to 50.
         """
         assert batch_repeat >= 1
         assert steps_range[0] < steps_range[1]
         assert max_epochs > 0
+        assert log_every > 0
         assert optimizer_method.lower() in (
             "adam",
             "adamw",
@@ -94,6 +200,35 @@ class BasicNCATrainer:
         else:
             self.lr = lr
         self.pool = pool
+        self.mixed_precision = mixed_precision and nca.device.type in ("cuda", "cpu")
+        # CPU autocast only supports bfloat16, older GPUs fall back to float16
+        self.amp_dtype = torch.bfloat16
+        if (
+            self.mixed_precision
+            and nca.device.type == "cuda"
+            and not torch.cuda.is_bf16_supported()
+        ):
+            self.amp_dtype = torch.float16
+        # loss scaling is only required for float16, bfloat16 has enough range
+        self.scaler = torch.amp.GradScaler(
+            "cuda", enabled=self.mixed_precision and self.amp_dtype == torch.float16
+        )
+        self.compile_model = compile_model
+        # small set of step counts used with compiled models, to limit recompilation
+        self._steps_buckets = sorted(
+            {
+                round(steps_range[0] + i * (steps_range[1] - 1 - steps_range[0]) / 4)
+                for i in range(5)
+            }
+        )
+        self.use_checkpoint = use_checkpoint
+        self.log_every = log_every
+        # compiled wrapper around self.nca, sharing its parameters; set up in train()
+        self._forward: Optional[Callable[..., Prediction]] = None
+        # dedicated RNG for sampling the number of time steps, seeded from torch's
+        # global seed, so runs are reproducible via fix_random_seed()
+        self._rng = torch.Generator(device="cpu")
+        self._rng.manual_seed(torch.initial_seed())
 
     def info(self) -> str:
         """
@@ -113,11 +248,62 @@ class BasicNCATrainer:
             "batch_repeat",
             "max_epochs",
             "optimizer_method",
+            "mixed_precision",
+            "compile_model",
+            "use_checkpoint",
+            "log_every",
         ):
             attribute_f = attribute.title().replace("_", " ")
             s += f"**{attribute_f}:** {getattr(self, attribute)}\n"
         return s
 
+    def _sample_steps(self) -> int:
+        """
+        Sample the number of NCA time steps for a training iteration from
+        steps_range (upper bound exclusive).
+
+        If the model is compiled, every distinct step count triggers a
+        recompilation, so steps are drawn from a small set of evenly spaced
+        buckets instead.
+
+        :returns [int]: Number of time steps.
+        """
+        low, high = self.steps_range
+        if not self.compile_model:
+            return int(torch.randint(low, high, (1,), generator=self._rng).item())
+        index = int(
+            torch.randint(len(self._steps_buckets), (1,), generator=self._rng).item()
+        )
+        return self._steps_buckets[index]
+
+    def _evaluate(self, dataloader: DataLoader) -> Dict[str, float]:
+        """
+        Compute metrics of the NCA on all batches of a dataset, averaged over batches.
+
+        :param dataloader [DataLoader]: Validation or test DataLoader.
+
+        :returns [Dict[str, float]]: Average metrics, mapped by their names.
+        """
+        self.nca.eval()
+        all_metrics: Dict[str, List[float]] = {}
+        for x, y in dataloader:
+            x = x.to(self.nca.device, non_blocking=True)
+            y = y.to(self.nca.device, non_blocking=True)
+            # TODO: move validation/inference steps parameter to NCA model itself
+            result = self.nca.validate(x, y, self.steps_validation)
+            if result is None:
+                # model does not support validation, e.g. growing tasks
+                continue
+            metrics, _ = result
+            for name in metrics:
+                if name not in all_metrics:
+                    all_metrics[name] = []
+                all_metrics[name].append(metrics[name])
+        avg_metrics: Dict[str, float] = {}
+        for name in all_metrics:
+            avg_metrics[name] = float(np.mean(all_metrics[name]))
+        return avg_metrics
+
     def train_iteration(
         self,
         x: torch.Tensor,
@@ -142,20 +328,34 @@ class BasicNCATrainer:
         """
         device = self.nca.device
         self.nca.train()
-        optimizer.zero_grad()
-        x_in = x.clone().to(self.nca.device)
-        prediction = self.nca(x_in, steps=steps)
-        losses = self.nca.loss(prediction.output_image, y.to(device))
-        losses["total"].backward()
+        optimizer.zero_grad(set_to_none=True)
+        x_in = x.to(device, non_blocking=True)
+        if device.type == "cuda":
+            x_in = x_in.contiguous(memory_format=torch.channels_last)
+        with torch.autocast(
+            device_type=device.type,
+            dtype=self.amp_dtype,
+            enabled=self.mixed_precision,
+        ):
+            forward = self._forward if self._forward is not None else self.nca
+            prediction = forward(x_in, steps=steps)
+        # losses run in full precision, some (e.g. BCE) are unsafe to autocast
+        losses = self.nca.loss(
+            prediction.output_image.float(), y.to(device, non_blocking=True)
+        )
+        # scaler is a no-op unless training with float16
+        self.scaler.scale(losses["total"]).backward()
 
         if self.gradient_clipping:
+            self.scaler.unscale_(optimizer)
             torch.nn.utils.clip_grad_norm_(self.nca.parameters(), 1.0)
-        optimizer.step()
+        self.scaler.step(optimizer)
+        self.scaler.update()
         scheduler.step()
-        if summary_writer:
+        if summary_writer and total_batch_iterations % self.log_every == 0:
             for key in losses:
                 summary_writer.add_scalar(
-                    f"Loss/train_{key}", losses[key], total_batch_iterations
+                    f"Loss/train_{key}", float(losses[key]), total_batch_iterations
                 )
         return prediction, losses
 
@@ -217,14 +417,35 @@ class BasicNCATrainer:
                 self.nca.parameters(), lr=self.lr, betas=self.adam_betas
             )
         scheduler = optim.lr_scheduler.ExponentialLR(optimizer, self.lr_gamma)
+        # Compile here rather than in the constructor, as the NCA may be swapped
+        # between calls, e.g. by KFoldCrossValidationTrainer.
+        # The compiled module shares its parameters with self.nca, which is still
+        # used for saving checkpoints, so state dict keys remain unchanged.
+        self._forward = None
+        if self.use_checkpoint:
+            # also reach backbones wrapped by other models, e.g. CascadeNCA
+            for module in self.nca.modules():
+                if isinstance(module, BasicNCAModel):
+                    module.use_checkpoint = True
+        if self.nca.device.type == "cuda":
+            # NHWC layout enables faster cuDNN convolution kernels
+            self.nca.to(memory_format=torch.channels_last)
+        if self.compile_model:
+            self._forward = torch.compile(self.nca, dynamic=False)
         best_acc = 0.0
         best_training_loss: float = np.inf
-        best_model = self.nca
+        # CPU snapshot of the best model parameters, if validation improved at all
+        best_state: Optional[Dict[str, torch.Tensor]] = None
         if self.model_path:
             best_path = Path(self.model_path).with_suffix(".best.pth")
         else:
             best_path = None
 
+        # side stream for preparing the next batch, shared by all epochs
+        prefetch_stream: Optional[torch.cuda.Stream] = None
+        if self.nca.device.type == "cuda":
+            prefetch_stream = torch.cuda.Stream(device=self.nca.device)
+
         # MAIN LOOP
         total_batch_iterations = 0
         for iteration in tqdm(range(self.max_epochs), desc="Epochs"):
@@ -232,33 +453,27 @@ class BasicNCATrainer:
                 if earlystopping.done():
                     break
 
+            # Prepare the next batch on a side stream while the current one trains
+            prefetcher = _CudaPrefetcher(dataloader_train, self.nca, prefetch_stream)
+            gen: Iterable = prefetcher
             # disable tqdm progress bar if dataset has only one sample, e.g. in the growing task
-            gen = iter(dataloader_train)
             if len(dataloader_train) > 3:
-                gen = tqdm(gen, desc="Batches")  # type: ignore[assignment]
+                gen = tqdm(prefetcher, total=len(dataloader_train), desc="Batches")
 
-            all_losses = []
+            # running sum of total losses stays on device, synchronized once per epoch
+            loss_sum = torch.zeros((), device=self.nca.device)
+            num_batches = 0
             # TRAINING
-            for sample in gen:
-                x, y = sample  # x: BCWH, y: BWHC
-                if len(y.shape) == 4:
-                    y = y.permute(0, 3, 1, 2) # BWHC --> BCWH
-
-                # Typically, our dataloader supplies a binary, grayscale, RGB or RGBA image.
-                # But the NCA operates on multiple hidden channels and output channels, so we
-                # need to pad the input image with zeros.
-                x = pad_input(x, self.nca, noise=self.nca.pad_noise)
-                # Call model-specific input preparation hook
-                x = self.nca.prepare_input(x)
+            for x, y in gen:  # x: BCWH, y: BCWH, already padded and on device
                 if self.pool is not None:
                     x = self.pool.sample(x)
 
                 # Batch duplication, slightly stabelizes the training
                 if self.batch_repeat > 1:
-                    x = torch.cat(self.batch_repeat * [x])
-                    y = torch.cat(self.batch_repeat * [y])
+                    x = _repeat_batch(x, self.batch_repeat)
+                    y = _repeat_batch(y, self.batch_repeat)
 
-                steps = np.random.randint(*self.steps_range)
+                steps = self._sample_steps()
                 prediction, losses = self.train_iteration(
                     x,
                     y,
@@ -273,11 +488,15 @@ class BasicNCATrainer:
                     total_batch_iterations += 1
                     if self.pool is not None:
                         self.pool.update(prediction.output_image)
-                    all_losses.append(losses["total"].item())
+                    loss_sum += losses["total"].detach()
+                    num_batches += 1
 
             with torch.no_grad():
                 # SAVE TRAINING LOSS
-                mean_training_loss = np.mean(all_losses).astype(float)
+                # NaN for an empty training loader, instead of a perfect-looking loss
+                mean_training_loss = (
+                    (loss_sum / num_batches).item() if num_batches else float("nan")
+                )
                 if mean_training_loss < best_training_loss:
                     best_training_loss = mean_training_loss
 
@@ -302,18 +521,8 @@ class BasicNCATrainer:
                     torch.save(self.nca.state_dict(), self.model_path)
 
                 if dataloader_val is not None:
-                    all_metrics: Dict[str, List[float]] = {}
-                    for sample in dataloader_val:
-                        x, y = sample
-                        # TODO: move validation/inference steps parameter to NCA model itself
-                        metrics, _ = unwrap(self.nca.validate(x, y, self.steps_validation))
-                        for name in metrics:
-                            if name not in all_metrics:
-                                all_metrics[name] = []
-                            all_metrics[name].append(metrics[name])
-                    avg_metrics: Dict[str, float] = {}
-                    for name in all_metrics:
-                        avg_metrics[name] = float(np.mean(all_metrics[name]))
+                    avg_metrics = self._evaluate(dataloader_val)
+                    for name in avg_metrics:
                         if summary_writer is not None:
                             summary_writer.add_scalar(
                                 f"Acc/Val/{name}", avg_metrics[name], iteration
@@ -328,18 +537,24 @@ class BasicNCATrainer:
                             if best_path:
                                 torch.save(self.nca.state_dict(), best_path)
                             best_acc = val_acc
-                            best_model = copy.deepcopy(self.nca)
+                            best_state = {
+                                k: v.detach().to("cpu", copy=True)
+                                for k, v in self.nca.state_dict().items()
+                            }
                         if earlystopping is not None:
                             earlystopping.step(val_acc)
         # After training: Compute metrics on test set for training summary
         with torch.no_grad():
             metrics = {}
             if dataloader_test is not None:
-                best_model.eval()
-                for image, label in dataloader_test:
-                    metrics.update(
-                        best_model.metrics(
-                            image.to(self.nca.device), label.to(self.nca.device)
-                        )
-                    )
+                # temporarily load the best parameters, keep the final ones afterwards
+                final_state = None
+                if best_state is not None:
+                    final_state = {
+                        k: v.detach().clone() for k, v in self.nca.state_dict().items()
+                    }
+                    self.nca.load_state_dict(best_state)
+                metrics = self._evaluate(dataloader_test)
+                if final_state is not None:
+                    self.nca.load_state_dict(final_state)
         return TrainingSummary(best_acc, best_path, best_training_loss, metrics)
@@ -59,6 +59,7 @@ def pad_input(
                 0.5,
                 0.225,
                 size=(x.shape[0], nca.num_hidden_channels, x.shape[2], x.shape[3]),
+                device=x.device,
             )
     return x
 
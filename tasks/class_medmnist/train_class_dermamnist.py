@@ -77,7 +77,10 @@ def train_class_dermamnist(
         replacement=True,
     )
     loader_train = torch.utils.data.DataLoader(
-        dataset_train, sampler=sampler_train, batch_size=batch_size
+        dataset_train,
+        sampler=sampler_train,
+        batch_size=batch_size,
+        pin_memory=device.type == "cuda",
     )
 
     # validation dataloader
@@ -94,7 +97,10 @@ def train_class_dermamnist(
         replacement=True,
     )
     loader_val = torch.utils.data.DataLoader(
-        dataset_val, sampler=sampler_val, batch_size=len(dataset_val)
+        dataset_val,
+        sampler=sampler_val,
+        batch_size=len(dataset_val),
+        pin_memory=device.type == "cuda",
     )
 
     nca = ClassificationNCAModel(
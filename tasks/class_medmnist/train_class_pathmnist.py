@@ -52,12 +52,20 @@ def train_class_pathmnist(
 
     dataset_train = PathMNIST(split="train", download=True, transform=T)
     loader_train = torch.utils.data.DataLoader(
-        dataset_train, shuffle=True, batch_size=batch_size, drop_last=True
+        dataset_train,
+        shuffle=True,
+        batch_size=batch_size,
+        drop_last=True,
+        pin_memory=device.type == "cuda",
     )
 
     dataset_val = PathMNIST(split="val", download=True, transform=T)
     loader_val = torch.utils.data.DataLoader(
-        dataset_val, shuffle=True, batch_size=32, drop_last=True
+        dataset_val,
+        shuffle=True,
+        batch_size=32,
+        drop_last=True,
+        pin_memory=device.type == "cuda",
     )
 
     nca = ClassificationNCAModel(
@@ -60,7 +60,11 @@ def finetune_growing_emoji(
         image_lizard, nca.num_channels, batch_size=batch_size
     )
     loader_lizard = DataLoader(
-        dataset_lizard, batch_size=batch_size, shuffle=False, drop_last=True
+        dataset_lizard,
+        batch_size=batch_size,
+        shuffle=False,
+        drop_last=True,
+        pin_memory=device.type == "cuda",
     )
 
     # Run initial training
@@ -85,7 +89,12 @@ def finetune_growing_emoji(
     # Create emoji dataset for finetuning
     image_dna = np.asarray(get_emoji_image("\N{RAT}"))
     dataset_dna = GrowingNCADataset(image_dna, nca.num_channels, batch_size=batch_size)
-    loader_dna = DataLoader(dataset_dna, batch_size=batch_size, shuffle=False)
+    loader_dna = DataLoader(
+        dataset_dna,
+        batch_size=batch_size,
+        shuffle=False,
+        pin_memory=device.type == "cuda",
+    )
 
     # Re-train with frozen final layer
     nca.finetune()
@@ -1,3 +1,7 @@
+from typing import Tuple
+
+import torch
+
 from PIL import Image, ImageDraw, ImageFont
 
 
@@ -27,3 +31,25 @@ def get_emoji_image(emoji: str = "🦎", padding: int = 8, size: int = 24):
             (size + 2 * padding, size + 2 * padding), Image.Resampling.LANCZOS
         )
         return image
+
+
+class CachedBatchLoader:
+    """
+    Minimal stand-in for a DataLoader that yields a single, pre-loaded batch
+    once per epoch.
+
+    Growing tasks train on copies of one fixed image, so the batch never changes
+    and only needs to be moved to the compute device a single time.
+    """
+
+    def __init__(self, batch: Tuple[torch.Tensor, torch.Tensor]):
+        """
+        :param batch: Tuple of seed and target image tensors.
+        """
+        self.batch = batch
+
+    def __len__(self) -> int:
+        return 1
+
+    def __iter__(self):
+        return iter((self.batch,))
@@ -49,7 +49,9 @@ def search_growing_emoji(
     # Create dataset containing a single growing emoji
     image = np.asarray(get_emoji_image())
     dataset = GrowingNCADataset(image, hidden_channels + 4, batch_size=batch_size)
-    dataloader_train = DataLoader(dataset, batch_size=batch_size, shuffle=False)
+    dataloader_train = DataLoader(
+        dataset, batch_size=batch_size, shuffle=False, pin_memory=device.type == "cuda"
+    )
 
     # Set up parameter ranges for grid search
     model_params = ParameterSet(
@@ -24,7 +24,7 @@ from ncalab import (
     Pool,
 )
 
-from growing_utils import get_emoji_image
+from growing_utils import get_emoji_image, CachedBatchLoader
 
 TASK_PATH = Path(__file__).parent.resolve()
 WEIGHTS_PATH = TASK_PATH / "weights"
@@ -62,7 +62,10 @@ def train_growing_emoji(
     # Create dataset containing a single growing emoji
     image = np.asarray(get_emoji_image())
     dataset = GrowingNCADataset(image, nca.num_channels, batch_size=batch_size)
-    dataloader_train = DataLoader(dataset, batch_size=batch_size, shuffle=False)
+    dataloader = DataLoader(dataset, batch_size=batch_size, shuffle=False)
+    # The batch is identical in every epoch, so load it onto the device only once
+    seed, target = next(iter(dataloader))
+    dataloader_train = CachedBatchLoader((seed.to(device), target.to(device)))
 
     # Create Trainer and run training
     trainer = BasicNCATrainer(
@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import copy
 import os
 import sys
 
@@ -7,6 +8,7 @@ sys.path.append(root_dir)
 
 import logging
 from pathlib import Path
+from typing import Tuple
 
 import click
 
@@ -49,6 +51,16 @@ FIGURE_PATH.mkdir(exist_ok=True)
 
 device = get_compute_device("cuda:0")
 
+# Reduced precision for NCA inference on CUDA devices
+AMP_DTYPE = (
+    torch.bfloat16
+    if torch.cuda.is_available() and torch.cuda.is_bf16_supported()
+    else torch.float16
+)
+
+# Number of DataLoader worker processes for test set preprocessing
+NUM_WORKERS = min(8, os.cpu_count() or 1)
+
 T = A.Compose(
     [
         A.CenterCrop(320, 320),
@@ -99,6 +111,106 @@ def boxplot(df: pd.DataFrame, colors):
     plt.show()
 
 
+def add_noise(x: torch.Tensor, variance: float, seed: int) -> torch.Tensor:
+    """
+    Add zero-mean Gaussian noise to an image tensor, on the tensor's device.
+
+    Noise is drawn from a generator seeded explicitly, so that all evaluated
+    models see identical noisy inputs.
+
+    :param x [torch.Tensor]: Image tensor.
+    :param variance [float]: Noise variance. If 0, x is returned unchanged.
+    :param seed [int]: Seed for the noise generator.
+
+    :returns [torch.Tensor]: Noisy image tensor.
+    """
+    if not variance:
+        return x
+    generator = torch.Generator(device=x.device)
+    generator.manual_seed(seed)
+    noise = torch.randn(
+        x.shape, generator=generator, device=x.device, dtype=x.dtype
+    )
+    return x + noise * variance**0.5
+
+
+def segmentation_metrics(
+    y_pred: torch.Tensor, y: torch.Tensor
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Compute Dice and IoU of a binary segmentation.
+
+    Results remain on the device as scalar tensors, so computing them does not
+    block on the GPU. Convert them in bulk once all samples are evaluated.
+
+    :param y_pred [torch.Tensor]: Predicted probabilities, CWH.
+    :param y [torch.Tensor]: Ground truth mask, BWH.
+
+    :returns: Tuple of scalar tensors (dice, iou).
+    """
+    tp, fp, fn, tn = smp.metrics.get_stats(
+        y_pred.unsqueeze(0),
+        y[:, None, :, :].long(),
+        mode="binary",
+        threshold=0.5,
+    )
+    dice = torch.mean(2.0 * tp / (2.0 * tp + fp + fn))
+    iou = torch.mean(tp / (tp + fp + fn))
+    return dice, iou
+
+
+def stack_folds(models: list):
+    """
+    Stack parameters and buffers of architecturally identical fold models, so the
+    whole ensemble can be evaluated in a single vectorized forward pass.
+
+    :param models [list]: Fold models in evaluation mode, sharing one architecture.
+
+    :returns: Function mapping an input batch to stacked predictions, FBCWH.
+    """
+    for model in models:
+        encoder = getattr(model, "encoder", None)
+        if hasattr(encoder, "set_swish"):
+            # memory efficient swish (EfficientNet) is a custom autograd.Function,
+            # which cannot be used under vmap
+            encoder.set_swish(memory_efficient=False)
+    params, buffers = torch.func.stack_module_state(models)
+    base = copy.deepcopy(models[0]).to("meta")
+
+    def call(p, b, x):
+        return torch.func.functional_call(base, (p, b), (x,))
+
+    def forward(x: torch.Tensor) -> torch.Tensor:
+        return torch.vmap(call, in_dims=(0, 0, None))(params, buffers, x)
+
+    return forward
+
+
+def forward_folds(models: list, x: torch.Tensor, out: torch.Tensor, streams=None):
+    """
+    Run each fold model on the same input and write its output channels to out.
+
+    If CUDA streams are given, each fold runs on its own stream so that the small
+    kernels of the individual folds can overlap on the GPU.
+
+    :param models [list]: Fold models.
+    :param x [torch.Tensor]: Input tensor, BCWH.
+    :param out [torch.Tensor]: Output tensor, FCWH.
+    :param streams: Optional list of CUDA streams, one per fold.
+    """
+    if streams is None:
+        for j, model in enumerate(models):
+            out[j] = model(x).output_channels[0]
+        return
+    current_stream = torch.cuda.current_stream(x.device)
+    for j, (model, stream) in enumerate(zip(models, streams)):
+        stream.wait_stream(current_stream)
+        with torch.cuda.stream(stream):
+            out[j] = model(x).output_channels[0]
+    for stream in streams:
+        current_stream.wait_stream(stream)
+
+
 def eval_segmentation_KID_baselines(folds: int, dataset_id: int, variances: list):
     dataset_test = KIDDataset(
         KID_DATASET_PATH_NNUNET
@@ -110,6 +222,16 @@ def eval_segmentation_KID_baselines(folds: int, dataset_id: int, variances: list
 
     model_sizes = list_trainable_parameters(make_model_zoo())
 
+    dataloader_test = DataLoader(
+        dataset_test,
+        batch_size=1,
+        num_workers=NUM_WORKERS,
+        pin_memory=device.type == "cuda",
+        prefetch_factor=2,
+    )
+    # preprocess the test set only once, and reuse it for all models
+    test_samples = [(sample["image"], sample["mask"]) for sample in dataloader_test]
+
     lesion_size_vs_dice = {}
     dice_for_variance = {}
 
@@ -121,41 +243,44 @@ def eval_segmentation_KID_baselines(folds: int, dataset_id: int, variances: list
         models = []
         for fold in range(folds):
             model = load_model(model_name, fold).to(device)
+            model.eval()
             models.append(model)
-
-        dataloader_test = DataLoader(dataset_test, batch_size=1)
+        ensemble = stack_folds(models)
 
         with torch.no_grad():
             dice_all = []
             iou_all = []
-
-            for variance in variances:
-                for i, sample in enumerate(iter(dataloader_test)):
-                    x, y = sample["image"], sample["mask"]
-                    lesion_size_vs_dice[model_name][0].append(np.sum(y.numpy()))
-                    if variance != 0:
-                        x += +(variance**0.5) * torch.randn(*x.shape)
-                    x = x.to(device)
-                    y = y.to(device)
-
-                    y_pred_ensemble = torch.zeros((folds, *y.shape))
-                    for j, model in enumerate(models):
-                        y_pred = model(x)
-                        y_pred_ensemble[j] = y_pred[0]
-                    y_pred_avg = torch.mean(y_pred_ensemble, dim=0).to(device)
-
-                    tp, fp, fn, tn = smp.metrics.get_stats(
-                        y_pred_avg.unsqueeze(0),
-                        y[:, None, :, :].long(),
-                        mode="binary",
-                        threshold=0.5,
-                    )
-                    dice = torch.mean(2.0 * tp / (2.0 * tp + fp + fn)).item()
-                    iou = torch.mean(tp / (tp + fp + fn)).item()
+            dice_per_variance: list = [[] for _ in variances]
+
+            # only the added noise differs between variances
+            for i, (x, y) in enumerate(test_samples):
+                x = x.to(device, non_blocking=True)
+                y = y.to(device, non_blocking=True)
+                lesion_size = y.sum()
+                for k, variance in enumerate(variances):
+                    lesion_size_vs_dice[model_name][0].append(lesion_size)
+                    x_noisy = add_noise(x, variance, seed=i * len(variances) + k)
+
+                    # all folds in one vectorized forward pass, FBCWH
+                    y_pred_ensemble = ensemble(x_noisy)
+                    y_pred_avg = torch.mean(y_pred_ensemble, dim=0)[0]
+
+                    dice, iou = segmentation_metrics(y_pred_avg, y)
                     lesion_size_vs_dice[model_name][1].append(dice)
                     dice_all.append(dice)
                     iou_all.append(iou)
-                dice_for_variance[model_name].append(np.mean(dice_all))
+                    dice_per_variance[k].append(dice)
+
+            # single synchronization with the device, after all samples are done
+            lesion_size_vs_dice[model_name] = (
+                torch.stack(lesion_size_vs_dice[model_name][0]).tolist(),
+                torch.stack(lesion_size_vs_dice[model_name][1]).tolist(),
+            )
+            dice_for_variance[model_name] = [
+                torch.stack(d).mean().item() for d in dice_per_variance
+            ]
+            dice_all = torch.stack(dice_all).tolist()
+            iou_all = torch.stack(iou_all).tolist()
 
         result.append(
             {
@@ -179,7 +304,13 @@ def eval_segmentation_KID_NCA(
         transform=T,
     )
 
-    dataloader_test = DataLoader(dataset_test, batch_size=1)
+    dataloader_test = DataLoader(
+        dataset_test,
+        batch_size=1,
+        num_workers=NUM_WORKERS,
+        pin_memory=device.type == "cuda",
+        prefetch_factor=2,
+    )
 
     lesion_size_vs_dice = ([], [])
 
@@ -199,39 +330,43 @@ def eval_segmentation_KID_NCA(
             )
         )
         cascade.eval()
-        models.append(cascade)
+        if device.type == "cuda":
+            cascade.to(memory_format=torch.channels_last)
+        models.append(torch.compile(cascade))
+
+    streams = None
+    if device.type == "cuda":
+        streams = [torch.cuda.Stream(device) for _ in models]
 
     with torch.no_grad():
         dice_all = []
         iou_all = []
-        dice_for_variance = []
-        for variance in variances:
-            for i, sample in enumerate(iter(dataloader_test)):
-                x, y = sample["image"], sample["mask"]
-                if variance != 0:
-                    x += +(variance**0.5) * torch.randn(*x.shape)
-                lesion_size_vs_dice[0].append(np.sum(y.numpy()))
-                x = x.to(device)
-                y = y.to(device)
+        dice_per_variance: list = [[] for _ in variances]
+
+        # load and preprocess each sample once, only the added noise differs
+        for i, sample in enumerate(dataloader_test):
+            x_clean, y = sample["image"], sample["mask"]
+            x_clean = x_clean.to(device, non_blocking=True)
+            y = y.to(device, non_blocking=True)
+            lesion_size = y.sum()
+            for k, variance in enumerate(variances):
+                lesion_size_vs_dice[0].append(lesion_size)
+                x = add_noise(x_clean, variance, seed=i * len(variances) + k)
                 x = pad_input(x, cascade, noise=True)
                 x = cascade.prepare_input(x)
-                x = x.permute(0, 2, 3, 1)
-
-                y_pred_ensemble = torch.zeros((folds, *y.shape))
-                for j, model in enumerate(models):
-                    y_pred = model(x)[
-                        ..., cascade.num_image_channels + cascade.num_hidden_channels :
-                    ].permute(0, 3, 1, 2)
-                    y_pred_ensemble[j] = y_pred[0]
-                y_pred_avg = torch.mean(y_pred_ensemble, dim=0).to(device)
-
-                tp, fp, fn, tn = smp.metrics.get_stats(
-                    y_pred_avg.unsqueeze(0),
-                    y[:, None, :, :].long(),
-                    mode="binary",
-                    threshold=0.5,
-                )
-                dice = torch.mean(2.0 * tp / (2.0 * tp + fp + fn)).item()
+                if device.type == "cuda":
+                    x = x.contiguous(memory_format=torch.channels_last)
+
+                y_pred_ensemble = torch.empty((folds, *y.shape), device=device)
+                with torch.autocast(
+                    device_type=device.type,
+                    dtype=AMP_DTYPE,
+                    enabled=device.type == "cuda",
+                ):
+                    forward_folds(models, x, y_pred_ensemble, streams)
+                y_pred_avg = torch.mean(y_pred_ensemble, dim=0)
+
+                dice, iou = segmentation_metrics(y_pred_avg, y)
                 # if dice < 0.2 and lesion_size_vs_dice[0][-1] > 10000:
                 #    sns.set_style("white")
                 #    plt.imshow(x.squeeze(0)[..., :3].cpu().numpy())
@@ -239,10 +374,18 @@ def eval_segmentation_KID_NCA(
                 #    plt.axis("off")
                 #    plt.show()
                 lesion_size_vs_dice[1].append(dice)
-                iou = torch.mean(tp / (tp + fp + fn)).item()
                 dice_all.append(dice)
                 iou_all.append(iou)
-            dice_for_variance.append(np.mean(dice_all))
+                dice_per_variance[k].append(dice)
+
+        # single synchronization with the device, after all samples are done
+        lesion_size_vs_dice = (
+            torch.stack(lesion_size_vs_dice[0]).tolist(),
+            torch.stack(lesion_size_vs_dice[1]).tolist(),
+        )
+        dice_for_variance = [torch.stack(d).mean().item() for d in dice_per_variance]
+        dice_all = torch.stack(dice_all).tolist()
+        iou_all = torch.stack(iou_all).tolist()
 
     model_parameters = filter(lambda p: p.requires_grad, nca.parameters())
     params = sum([np.prod(p.size()) for p in model_parameters])
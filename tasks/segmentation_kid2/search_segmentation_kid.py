@@ -123,10 +123,18 @@ def search_segmentation_KID(batch_size: int):
     )
 
     loader_train = torch.utils.data.DataLoader(
-        train_dataset, shuffle=True, batch_size=batch_size, drop_last=True
+        train_dataset,
+        shuffle=True,
+        batch_size=batch_size,
+        drop_last=True,
+        pin_memory=device.type == "cuda",
     )
     loader_val = torch.utils.data.DataLoader(
-        val_dataset, shuffle=True, batch_size=batch_size, drop_last=True
+        val_dataset,
+        shuffle=True,
+        batch_size=batch_size,
+        drop_last=True,
+        pin_memory=device.type == "cuda",
     )
 
     trainer_params = ParameterSet(
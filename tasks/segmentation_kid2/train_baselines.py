@@ -158,6 +158,7 @@ def train_baselines(folds, dataset_id):
                 / "nnUNet_raw"
                 / f"Dataset{dataset_id:03d}_KID2vascular",
                 T,
+                pin_memory=device.type == "cuda",
             )
             optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
 
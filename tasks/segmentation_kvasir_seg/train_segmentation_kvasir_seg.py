@@ -93,10 +93,18 @@ def train_segmentation_kvasir_seg(batch_size: int, hidden_channels: int):
     val_split = Subset(dataset, val_indices)
 
     loader_train = torch.utils.data.DataLoader(
-        train_split, shuffle=True, batch_size=batch_size, drop_last=True
+        train_split,
+        shuffle=True,
+        batch_size=batch_size,
+        drop_last=True,
+        pin_memory=device.type == "cuda",
     )
     loader_val = torch.utils.data.DataLoader(
-        val_split, shuffle=True, batch_size=batch_size, drop_last=True
+        val_split,
+        shuffle=True,
+        batch_size=batch_size,
+        drop_last=True,
+        pin_memory=device.type == "cuda",
     )
 
     trainer = BasicNCATrainer(cascade, WEIGHTS_PATH / "segmentation_kvasir_seg.pth")
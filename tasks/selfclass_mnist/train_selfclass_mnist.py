@@ -61,15 +61,18 @@ def train_selfclass_mnist(
     train_split = Subset(mnist_train, train_indices)
     val_split = Subset(mnist_train, val_indices)
 
+    device = get_compute_device(f"cuda:{gpu_index}" if gpu else "cpu")
+
     loader_train = torch.utils.data.DataLoader(
-        train_split, shuffle=True, batch_size=batch_size
+        train_split,
+        shuffle=True,
+        batch_size=batch_size,
+        pin_memory=device.type == "cuda",
     )
     loader_val = torch.utils.data.DataLoader(
-        val_split, shuffle=True, batch_size=32
+        val_split, shuffle=True, batch_size=32, pin_memory=device.type == "cuda"
     )
 
-    device = get_compute_device(f"cuda:{gpu_index}" if gpu else "cpu")
-
     nca = ClassificationNCAModel(
         device,
         num_image_channels=1,
@@ -1,12 +1,10 @@
 #!/usr/bin/env python3
-import pytest
-
-import albumentations as A  # type: ignore[import-untyped]
-from albumentations.pytorch import ToTensorV2  # type: ignore[import-untyped]
+import os
 
-from torch.utils.data import Dataset, DataLoader
+import pytest
 
-import numpy as np
+import torch
+from torch.utils.data import DataLoader, TensorDataset
 
 from ncalab import (
     DepthNCAModel,
@@ -16,55 +14,82 @@ from ncalab import (
 )
 
 
-T = A.Compose(
-    [
-        ToTensorV2(),
-    ]
-)
+DEVICE = get_compute_device("cpu")
 
+# Prepare batches in background workers, unless running on a single core.
+# Device is CPU, so pinned memory would not help.
+if (os.cpu_count() or 1) > 1:
+    LOADER_KWARGS: dict = dict(
+        num_workers=2, persistent_workers=True, prefetch_factor=2, pin_memory=False
+    )
+else:
+    LOADER_KWARGS = dict(num_workers=0, pin_memory=False)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def single_thread():
+    # tensors in this test are far too small to profit from intra-op threading
+    num_threads = torch.get_num_threads()
+    torch.set_num_threads(1)
+    yield
+    torch.set_num_threads(num_threads)
+
+
+def _collate(batch):
+    # all samples are identical, so broadcast the first one instead of stacking;
+    # nothing downstream writes to the batch in place, so the views need no copy
+    img, mask = batch[0]
+    B = len(batch)
+    return img.unsqueeze(0).expand(B, *img.shape), mask.unsqueeze(0).expand(
+        B, *mask.shape
+    )
 
-class DummyDepthDataset(Dataset):
-    def __init__(self, transform=None) -> None:
-        super().__init__()
-        self.images = np.ones((16, 32, 32, 3), dtype=np.float32)
-        self.masks = np.ones((16, 32, 32), dtype=np.float32)
-        self.transform = transform
 
-    def __len__(self):
-        return self.images.shape[0]
+# models are trained in place, so every test gets fresh ones
+@pytest.fixture
+def nca():
+    return DepthNCAModel(
+        DEVICE,
+        num_image_channels=3,
+        num_hidden_channels=5,
+        pad_noise=False,
+    )
 
-    def __getitem__(self, index):
-        sample = {"image": self.images[index], "mask": self.masks[index]}
-        if self.transform is not None:
-            sample = self.transform(**sample)
-        return sample["image"], sample["mask"]
 
+@pytest.fixture
+def cascade(nca):
+    return CascadeNCA(nca, [2, 1], [3, 3])
 
-def test_cascade_depth_training_with_validation():
-    """
-    Test if a basic NCA trainer runs through for a few epochs without exception.
-    """
-    device = get_compute_device("cpu")
 
-    nca = DepthNCAModel(
-        device,
-        num_image_channels=3,
-        num_hidden_channels=5,
-        pad_noise=False,
+@pytest.fixture(scope="module")
+def dataset():
+    return TensorDataset(
+        torch.ones(2, 3, 32, 32, dtype=torch.float32),
+        torch.ones(2, 32, 32, dtype=torch.float32),
     )
 
-    cascade = CascadeNCA(nca, [2, 1], [3, 3])
 
-    dataset = DummyDepthDataset(transform=T)
-    dataloader_train = DataLoader(dataset, batch_size=8, shuffle=False)
-    dataloader_val = DataLoader(dataset, batch_size=8, shuffle=False)
+@pytest.fixture(scope="module")
+def dataloader(dataset):
+    # training and validation data are identical, so share a single worker pool
+    return DataLoader(
+        dataset, batch_size=2, shuffle=False, collate_fn=_collate, **LOADER_KWARGS
+    )
 
-    try:
-        trainer = BasicNCATrainer(cascade, None, max_epochs=3)
-    except Exception as e:
-        pytest.fail(str(e))
 
-    try:
-        trainer.train(dataloader_train, dataloader_val, save_every=100)
-    except Exception as e:
-        pytest.fail(str(e))
+def test_cascade_depth_training_with_validation(cascade, dataloader):
+    """
+    Test if a basic NCA trainer runs through an epoch without exception.
+    """
+    trainer = BasicNCATrainer(cascade, None, max_epochs=1)
+    # sentinel: never trigger checkpoint I/O during unit test
+    trainer.train(dataloader, dataloader, save_every=10**9)
+
+
+def test_cascade_depth_training_mixed_precision(cascade, dataloader):
+    """
+    Test if a basic NCA trainer runs through an epoch in bfloat16 autocast.
+    """
+    trainer = BasicNCATrainer(cascade, None, max_epochs=1, mixed_precision=True)
+    assert trainer.amp_dtype == torch.bfloat16
+    trainer.train(dataloader, dataloader, save_every=10**9)
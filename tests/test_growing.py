@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import pytest
 
+import torch
 from torch.utils.data import DataLoader
 
 import numpy as np
@@ -41,3 +42,38 @@ def test_growing_training():
         trainer.train(dataloader_train, save_every=100)
     except Exception as e:
         pytest.fail(e)
+
+
+def test_growing_checkpoint_gradients():
+    """
+    Test if gradient checkpointing over time steps leaves the gradients unchanged.
+    """
+    device = get_compute_device("cpu")
+
+    torch.manual_seed(0)
+    nca = GrowingNCAModel(
+        device,
+        num_image_channels=4,
+        num_hidden_channels=5,
+        use_alive_mask=True,
+    )
+    # final layer is initialized with zeros, which would make most gradients vanish
+    with torch.no_grad():
+        torch.nn.init.normal_(nca.network[-1].weight, std=0.1)
+    x = torch.zeros((2, nca.num_channels, 16, 16))
+    # non-zero seed in the center, as in GrowingNCAModel.grow
+    x[:, 3:, 8, 8] = 1.0
+    target = torch.rand((2, nca.num_image_channels, 16, 16))
+
+    gradients = []
+    for use_checkpoint in (False, True):
+        nca.use_checkpoint = use_checkpoint
+        nca.zero_grad(set_to_none=True)
+        torch.manual_seed(1)
+        prediction = nca(x, steps=8)
+        nca.loss(prediction.output_image, target)["total"].backward()
+        gradients.append([p.grad.clone() for p in nca.parameters()])
+
+    assert all(g.abs().sum() > 0 for g in gradients[0])
+    for g, g_checkpoint in zip(*gradients):
+        assert torch.allclose(g, g_checkpoint)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+import pytest
+
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+from ncalab import (
+    SegmentationNCAModel,
+    BasicNCATrainer,
+    get_compute_device,
+)
+
+
+DEVICES = ["cpu"]
+if torch.cuda.is_available():
+    DEVICES.append("cuda")
+
+
+@pytest.mark.parametrize("device_name", DEVICES)
+def test_segmentation_training_mixed_precision(device_name):
+    """
+    Test if a segmentation NCA (Dice + BCE loss) trains in mixed precision.
+    """
+    device = get_compute_device(device_name)
+
+    nca = SegmentationNCAModel(
+        device,
+        num_image_channels=3,
+        num_hidden_channels=5,
+        num_classes=1,
+        pad_noise=False,
+    )
+
+    dataset = TensorDataset(
+        torch.rand(4, 3, 32, 32),
+        (torch.rand(4, 32, 32) > 0.5).float(),
+    )
+    dataloader_train = DataLoader(dataset, batch_size=2, shuffle=False)
+
+    trainer = BasicNCATrainer(
+        nca, None, steps_range=(4, 8), max_epochs=1, mixed_precision=True
+    )
+    assert trainer.mixed_precision
+    trainer.train(dataloader_train, save_every=10**9)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+import numpy as np
+
+from ncalab import (
+    DepthNCAModel,
+    GrowingNCADataset,
+    GrowingNCAModel,
+    BasicNCATrainer,
+    get_compute_device,
+)
+
+
+class LabelMeanDepthNCAModel(DepthNCAModel):
+    """
+    Depth model reporting the mean label of each batch as its only metric.
+    """
+
+    def validate(self, image, label, steps):
+        return {"label_mean": label.mean().item()}, None
+
+
+def test_test_metrics_averaged_over_batches():
+    """
+    Test if test set metrics in the training summary are averaged over all batches.
+    """
+    device = get_compute_device("cpu")
+
+    nca = LabelMeanDepthNCAModel(
+        device,
+        num_image_channels=3,
+        num_hidden_channels=5,
+        pad_noise=False,
+    )
+
+    dataset_train = TensorDataset(torch.ones(2, 3, 32, 32), torch.ones(2, 32, 32))
+    dataloader_train = DataLoader(dataset_train, batch_size=2, shuffle=False)
+    # two test batches, with label means 0 and 1
+    dataset_test = TensorDataset(
+        torch.ones(4, 3, 32, 32),
+        torch.cat((torch.zeros(2, 32, 32), torch.ones(2, 32, 32))),
+    )
+    dataloader_test = DataLoader(dataset_test, batch_size=2, shuffle=False)
+
+    trainer = BasicNCATrainer(nca, None, steps_range=(4, 8), max_epochs=1)
+    summary = trainer.train(
+        dataloader_train, dataloader_test=dataloader_test, save_every=10**9
+    )
+    assert summary.metrics["label_mean"] == 0.5
+
+
+def test_test_metrics_without_validation():
+    """
+    Test if a model without validation (growing NCA) can be trained with a test set.
+    """
+    device = get_compute_device("cpu")
+
+    nca = GrowingNCAModel(
+        device,
+        num_image_channels=4,
+        num_hidden_channels=5,
+        use_alive_mask=False,
+    )
+
+    image = np.zeros((16, 16, 4))
+    dataset = GrowingNCADataset(image, nca.num_channels, batch_size=2)
+    dataloader = DataLoader(dataset, batch_size=2, shuffle=False)
+
+    trainer = BasicNCATrainer(nca, None, steps_range=(4, 8), max_epochs=1)
+    summary = trainer.train(dataloader, dataloader_test=dataloader, save_every=10**9)
+    assert summary.metrics == {}